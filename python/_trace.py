@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ==============================================================================
+import importlib.util
 from collections import abc
 from tensorflow.core.protobuf import config_pb2
 from tensorflow.core.protobuf import meta_graph_pb2
@@ -31,6 +32,10 @@ from tensorflow.neuron.python import utils
 from tensorflow.neuron.python.neuron_cc import list_operators
 
 
+# probe once at import time; the hot path only needs the boolean
+_HAS_HLO2NEURON = importlib.util.find_spec('hlo2neuron') is not None
+
+
 def trace(func, example_inputs, subgraph_builder_function=None):
     """Convert a function to a Neuron-optimized `keras.Model`.
 
@@ -51,9 +56,20 @@ def trace(func, example_inputs, subgraph_builder_function=None):
     if not isinstance(func, function.ConcreteFunction):
         func = func.get_concrete_function(*example_inputs)
 
-    # convert all variables to constants
-    with utils.change_grappler_logging_level_according_to_cc_flags():
-        cfunc = convert_to_constants.convert_variables_to_constants_v2(func)
+    # convert all variables to constants; skip the pass only when it would
+    # rebuild the full graph for nothing. The pass folds *every* capture into
+    # a Const node -- variables via their reads, plain EagerTensors via
+    # .numpy() -- so any captured tensor requires it, and
+    # PartitionedCall/StatefulPartitionedCall may hide variable reads inside
+    # nested functions that the pass also inlines. Only capture-free graphs
+    # without such ops can take the fast path
+    variable_op_types = {'VarHandleOp', 'ReadVariableOp', 'VariableV2', 'Variable',
+                         'PartitionedCall', 'StatefulPartitionedCall'}
+    if func.graph.captures or any(op.type in variable_op_types for op in func.graph.get_operations()):
+        with utils.change_grappler_logging_level_according_to_cc_flags():
+            cfunc = convert_to_constants.convert_variables_to_constants_v2(func)
+    else:
+        cfunc = func
     graph_def = cfunc.graph.as_graph_def(add_shapes=True)
     original_graph_def = graph_def
 
@@ -65,11 +81,11 @@ def trace(func, example_inputs, subgraph_builder_function=None):
     graph_def = _run_grappler_on_main_graph(graph_def, cfunc, subgraph_builder_function)
 
     # call graph_def_util/meta_graph_util passes
-    graph_def = gdu.run_graph_def_pass_in_subgraphs(graph_def, gdu.convert_shape_to_constant)
+    graph_def = gdu.run_graph_def_passes_in_subgraphs(graph_def, gdu.convert_shape_to_constant)
     graph_def = mgu.run_grappler_on_subgraphs(graph_def)
     graph_def = gdu.run_compiler_on_subgraphs(graph_def)
     graph_def = gdu.restore_compiler_failures(graph_def, original_graph_def)
-    graph_def = gdu.run_graph_def_pass_in_subgraphs(graph_def, gdu.erase_large_constants)
+    graph_def = gdu.run_graph_def_passes_in_subgraphs(graph_def, gdu.erase_large_constants)
     graph_def = gdu.set_execution_plan(graph_def)
     graph_def = gdu.maybe_relax_placeholder_shapes(graph_def)
 
@@ -90,12 +106,22 @@ class AwsNeuronModel(Model):
         self._aws_neuron_output_type = None
         if isinstance(structured_outputs, abc.Mapping):
             self._aws_neuron_output_type = type(structured_outputs)
+        # precompute the argument-keyword lookups; call() runs once per inference
+        arg_keywords = getattr(func, '_arg_keywords', None)
+        self._aws_neuron_arg_keywords = arg_keywords
+        self._aws_neuron_arg_keyword_set = frozenset(arg_keywords) if arg_keywords is not None else None
 
     def call(self, inputs, *args):
-        flat_inputs = nest.flatten((inputs, args))
-        if isinstance(inputs, abc.Mapping) and not args:
-            if set(inputs.keys()) == set(self.aws_neuron_function._arg_keywords):
-                flat_inputs = [inputs[kw] for kw in self.aws_neuron_function._arg_keywords]
+        if isinstance(inputs, abc.Mapping):
+            if not args and inputs.keys() == self._aws_neuron_arg_keyword_set:
+                flat_inputs = [inputs[kw] for kw in self._aws_neuron_arg_keywords]
+            else:
+                flat_inputs = nest.flatten((inputs, args))
+        elif not args and isinstance(inputs, ops.Tensor):
+            # single-tensor fast path; no structure to flatten
+            flat_inputs = [inputs]
+        else:
+            flat_inputs = nest.flatten((inputs, args))
         outputs = self.aws_neuron_function(*flat_inputs)
         if self._aws_neuron_output_type is not None:
             outputs = self._aws_neuron_output_type(**outputs)
@@ -113,12 +139,14 @@ def _get_shape_feed_dict(func, inputs):
             input_dict, = func_args
         else:
             input_dict = {akw: ts.op for akw, ts in zip(func._arg_keywords, func.inputs)}
-        return {'{}:0'.format(spec.name): inputs[name].shape for name, spec in input_dict.items()}
+        return {'{}:0'.format(spec.name): tuple(inputs[name].shape) for name, spec in input_dict.items()}
     else:
         input_names = _get_input_names(func)
         inputs_list = [inputs] if isinstance(inputs, ops.Tensor) else inputs
         inputs_list = nest.flatten(inputs_list)
-        return {name: ts.shape for name, ts in zip(input_names, inputs_list)}
+        # materialize dimension tuples once; downstream shape encoding only
+        # needs to iterate sizes and should not re-touch TensorShape properties
+        return {name: tuple(ts.shape) for name, ts in zip(input_names, inputs_list)}
 
 
 def _run_grappler_on_main_graph(graph_def, cfunc, subgraph_builder_function):
@@ -136,28 +164,37 @@ def _run_grappler_on_main_graph(graph_def, cfunc, subgraph_builder_function):
     fuser_config = rewriter_config.custom_optimizers.add()
     fuser_config.name = 'aws_neuron_fuse_supported_operators'
     fuser_param_map = fuser_config.parameter_map
-    fuser_param_map['supported_op_types'].list.s.extend(item.encode() for item in list_operators())
+    supported_op_types = list_operators()
+    encoded_op_types = [item.encode() for item in supported_op_types]
+    fuser_param_map['supported_op_types'].list.s.extend(encoded_op_types)
     if subgraph_builder_function is None:
         fuser_param_map['fuse_foldable_nodes'].b = True
         fuser_param_map['prune_small_subgraphs_ratio'].f = 0.8
-        try:
-            import hlo2neuron
-        except ImportError:
-            no_fuse_ops = []
-        else:
-            no_fuse_ops = _find_pad_ops_preceding_conv2d(cfunc.graph)
+        encoded_no_fuse_ops = []
+        if _HAS_HLO2NEURON:
+            no_fuse_ops = _find_pad_ops_preceding_conv2d(cfunc.graph, supported_op_types)
+            encoded_no_fuse_ops = [item.encode() for item in no_fuse_ops]
     else:
-        force_fuse_ops = [node.name for node in graph_def.node if subgraph_builder_function(node)]
-        fuser_param_map['force_fuse_ops'].list.s.extend(item.encode() for item in force_fuse_ops)
-        no_fuse_ops = [node.name for node in graph_def.node]
-    if no_fuse_ops:
-        fuser_param_map['no_fuse_ops'].list.s.extend(item.encode() for item in no_fuse_ops)
-
-    # call all grappler passes
+        # encode every node name once; no_fuse_ops takes all of them and
+        # force_fuse_ops selects a subset of the same bytes
+        encoded_node_names = [node.name.encode() for node in graph_def.node]
+        encoded_force_fuse_ops = [encoded for node, encoded in zip(graph_def.node, encoded_node_names)
+                                  if subgraph_builder_function(node)]
+        fuser_param_map['force_fuse_ops'].list.s.extend(encoded_force_fuse_ops)
+        encoded_no_fuse_ops = encoded_node_names
+    if encoded_no_fuse_ops:
+        fuser_param_map['no_fuse_ops'].list.s.extend(encoded_no_fuse_ops)
+
+    # call all grappler passes. The caller still aliases this proto as
+    # original_graph_def for failure restoration, so this del only clears the
+    # local name; the one before the second OptimizeGraph below is what
+    # actually frees an intermediate graph
+    del graph_def
     with utils.change_grappler_logging_level_according_to_cc_flags():
         graph_def = tf_optimizer.OptimizeGraph(opt_config, meta_graph_def)
     if subgraph_builder_function is not None:
         opt_config, meta_graph_def = _build_optimize_graph_args(graph_def, cfunc)
+        del graph_def
         optimizers = opt_config.graph_options.rewrite_options.optimizers
         optimizers.extend(pruning_passes)
         with utils.change_grappler_logging_level_according_to_cc_flags():
@@ -166,7 +203,8 @@ def _run_grappler_on_main_graph(graph_def, cfunc, subgraph_builder_function):
 
 
 def _build_optimize_graph_args(graph_def, cfunc):
-    meta_graph_def = meta_graph_pb2.MetaGraphDef(graph_def=graph_def)
+    meta_graph_def = meta_graph_pb2.MetaGraphDef()
+    meta_graph_def.graph_def.CopyFrom(graph_def)
     sig_def = mgu.build_signature_def(cfunc.inputs, cfunc.outputs)
     meta_graph_def.signature_def['serving_default'].CopyFrom(sig_def)
     opt_config = config_pb2.ConfigProto()
@@ -176,27 +214,33 @@ def _build_optimize_graph_args(graph_def, cfunc):
     return opt_config, meta_graph_def
 
 
-def _find_pad_ops_preceding_conv2d(graph):
+def _find_pad_ops_preceding_conv2d(graph, supported_op_types):
     # exclude Pad that precedes Conv2D for HLO frontend
     no_fuse_ops = []
-    supported_op_types = list_operators()
-    for op in graph.get_operations():
-        if op.type == 'Pad':
-            consumers = op.outputs[0].consumers()
-            if consumers[0].type == 'Conv2D':
-                curr_op = op
-                pad_input_ops = [curr_op]
-                while curr_op.inputs and curr_op.type in supported_op_types:
-                    curr_op = curr_op.inputs[0].op
-                    pad_input_ops.append(curr_op)
-                if len(pad_input_ops) <= 3:
-                    no_fuse_ops.append(op.inputs[1].op.name)
-                    no_fuse_ops.extend(piop.name for piop in pad_input_ops)
+    supported_op_types = frozenset(supported_op_types)
+    # fetch each op's type string once; Operation.type re-reads the C++ node def
+    op_types = {op: op.type for op in graph.get_operations()}
+    for op, op_type in op_types.items():
+        if op_type != 'Pad':
+            continue
+        consumers = op.outputs[0].consumers()
+        if consumers and op_types[consumers[0]] == 'Conv2D':
+            curr_op = op
+            pad_input_ops = [curr_op]
+            while curr_op.inputs and op_types[curr_op] in supported_op_types:
+                curr_op = curr_op.inputs[0].op
+                pad_input_ops.append(curr_op)
+            if len(pad_input_ops) <= 3:
+                no_fuse_ops.append(op.inputs[1].op.name)
+                no_fuse_ops.extend(piop.name for piop in pad_input_ops)
     return no_fuse_ops
 
 
 def _get_input_names(func):
-    captured_inputs = {ts.name for _, ts in func.graph.captures}
+    captures = func.graph.captures
+    if not captures:
+        return [ts.name for ts in func.inputs]
+    captured_inputs = frozenset(ts.name for _, ts in captures)
     return [ts.name for ts in func.inputs if ts.name not in captured_inputs]
 
 
@@ -205,6 +249,10 @@ def _get_output_names(func):
     if isinstance(structured_outputs, dict):
         # return a map from output argument name to symbolic tensor name
         # in order to let the WrappedFunction's return dictionary have the correct keys
+        if all(name == spec.name for name, spec in structured_outputs.items()):
+            # identity map; nest.flatten traverses dict values in sorted-key
+            # order, so the recursive flatten can be skipped entirely
+            return {name: ts.name for ts, name in zip(outputs, sorted(structured_outputs))}
         tensor_specs = nest.flatten(structured_outputs, expand_composites=True)
         tensor_spec_name_map = {spec.name: name for name, spec in structured_outputs.items()}
         tensor_spec_names = [tensor_spec_name_map[spec.name] for spec in tensor_specs]
@@ -15,6 +15,7 @@
 import os
 import sys
 import subprocess
+from collections import deque
 import numpy as np
 import tensorflow as tf
 from tensorflow.neuron import fuse
@@ -365,10 +366,14 @@ def actualtest_fuse_eager_execution():
 
 
 def _unpack_recursive(outputs):
-    while any(isinstance(out, (tuple, list)) for out in outputs):
-        unpacked = []
-        for out in outputs:
-            func = unpacked.extend if isinstance(out, (tuple, list)) else unpacked.append
-            func(out)
-        outputs = unpacked
-    return outputs
+    # flatten nested tuples/lists in one pass instead of rebuilding the list
+    # once per nesting level
+    unpacked = []
+    stack = deque(outputs)
+    while stack:
+        out = stack.popleft()
+        if isinstance(out, (tuple, list)):
+            stack.extendleft(reversed(out))
+        else:
+            unpacked.append(out)
+    return unpacked
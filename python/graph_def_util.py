@@ -12,9 +12,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ==============================================================================
+import os
 import math
 import reprlib
 from collections import namedtuple
+from concurrent import futures
 from tensorflow.core.framework import graph_pb2
 from tensorflow.python.framework import dtypes
 from tensorflow.python.framework.ops import convert_to_tensor
@@ -204,15 +206,23 @@ def convert_shape_to_constant(graph_def):
 
 
 def run_graph_def_pass_in_subgraphs(graph_def, graph_def_pass):
+    return run_graph_def_passes_in_subgraphs(graph_def, graph_def_pass)
+
+
+def run_graph_def_passes_in_subgraphs(graph_def, *graph_def_passes):
+    # parse and re-serialize each subgraph only once for all passes
     for node in get_neuron_nodes(graph_def):
         subgraph_def = get_subgraph_def(node)
-        subgraph_def = graph_def_pass(subgraph_def)
+        for graph_def_pass in graph_def_passes:
+            subgraph_def = graph_def_pass(subgraph_def)
         node.attr[knGraphDef].s = subgraph_def.SerializeToString()
     return graph_def
 
 
 def run_compiler_on_subgraphs(graph_def):
     IOTensor = namedtuple('IOTensor', 'name, dtype, shape')
+    compilable_nodes = []
+    compile_args = []
     for node in get_neuron_nodes(graph_def):
         is_compilable, reason = neuron_node_is_compilable(node)
         if not is_compilable:
@@ -237,8 +247,28 @@ def run_compiler_on_subgraphs(graph_def):
         for sg_node in subgraph_def.node:
             sg_node.attr.pop(kNeuronInferredShapes)
 
-        # setup workdir and run neuron-cc
-        executable, inputs, outputs = compile_savetemps(subgraph_def, inputs, outputs, node.name)
+        compilable_nodes.append(node)
+        compile_args.append((subgraph_def, inputs, outputs, node.name))
+
+    # setup workdirs and run neuron-cc; compilation happens in neuron-cc child
+    # processes, so threads are enough to overlap the subgraph compilations
+    max_workers = min(len(compile_args), os.cpu_count() or 1)
+    try:
+        env_max_workers = int(os.environ['NEURON_CC_PARALLEL_COMPILES'])
+    except (KeyError, ValueError):
+        pass
+    else:
+        if env_max_workers > 0:
+            # the environment variable caps the computed count; neuron-cc can
+            # be memory-hungry and oversubscribing it risks OOM
+            max_workers = min(max_workers, env_max_workers)
+    if max_workers > 1:
+        with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            fut_list = [executor.submit(compile_savetemps, *args) for args in compile_args]
+            compile_results = [fut.result() for fut in fut_list]
+    else:
+        compile_results = [compile_savetemps(*args) for args in compile_args]
+    for node, (executable, inputs, outputs) in zip(compilable_nodes, compile_results):
         if executable:
             node.attr[knExecutable].s = executable
             node.attr[knInputNames].list.s[:] = [ts.name.encode() for ts in inputs]
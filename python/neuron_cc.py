@@ -15,11 +15,14 @@
 import sys
 import os
 import json
+import hashlib
 import subprocess
 import tempfile
 from distutils import spawn
 from distutils.version import LooseVersion
+from functools import lru_cache
 from tensorflow_neuron import __version__
+from tensorflow.python.platform import tf_logging as logging
 from tensorflow.neuron.python import utils
 
 
@@ -27,14 +30,23 @@ def list_operators():
     neuron_cc = find_neuron_cc()
     if neuron_cc is None:
         return set()
-    command = [neuron_cc, 'list-operators', '--framework', 'TENSORFLOW']
     try:
-        list_operators_output = subprocess.check_output(command)
+        # lru_cache does not memoize raising calls, so a transient neuron-cc
+        # failure is retried on the next trace instead of pinning set()
+        return _list_operators_cached(neuron_cc)
     except subprocess.CalledProcessError:
         logging.warning('neuron-cc is not behaving correctly. Please check neuron-cc '
                         'installation, or reinstall by "pip install --force neuron-cc".')
         return set()
-    supported_op_types = {op_type.strip() for op_type in list_operators_output.decode()[:-1].split('\n')}
+
+
+@lru_cache(maxsize=1)
+def _list_operators_cached(neuron_cc):
+    command = [neuron_cc, 'list-operators', '--framework', 'TENSORFLOW']
+    proc = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True)
+    # splitlines drops the trailing newline natively, without the full-buffer
+    # copy a [:-1] slice would make
+    supported_op_types = {op_type.strip() for op_type in proc.stdout.decode().splitlines()}
     tf_reserved_ops = [
         'Placeholder',
         'IdentityN',
@@ -42,13 +54,27 @@ def list_operators():
     return supported_op_types.difference(tf_reserved_ops)
 
 
+# None until the first stdin-fed compile resolves whether this neuron-cc
+# build can read /dev/stdin; latched to True/False afterwards so at most one
+# failing compile ever pays the file-path retry
+_neuron_cc_reads_stdin = None
+
+
 def compile_savetemps(graph_def, inputs, outputs, node_name):
     """Returns raw neff bytes (empty bytes if neuron-cc crashed)
+
+    `graph_def` may be given as already-serialized `bytes` to let callers
+    that hold the serialized form skip a redundant `SerializeToString`.
     """
     error_return_value = b'', None, None
-    # form io-config
+    # form io-config; hoist the shape proto into a local so each tensor
+    # crosses into protobuf internals once rather than once per attribute
+    io_config_inputs = {}
+    for ts in inputs:
+        shape = ts.shape
+        io_config_inputs[ts.name] = [[dim.size for dim in shape.dim], ts.dtype.name]
     io_config = {
-        'inputs': {ts.name: [[dim.size for dim in ts.shape.dim], ts.dtype.name] for ts in inputs},
+        'inputs': io_config_inputs,
         'outputs': [ts.name for ts in outputs],
     }
 
@@ -59,28 +85,85 @@ def compile_savetemps(graph_def, inputs, outputs, node_name):
     neuron_cc_input_name = 'graph_def.pb'
     neuron_executable_name = 'graph_def.neff'
     tfn_args, compiler_args = utils.parse_neuron_cc_flags()
+    if isinstance(graph_def, bytes):
+        serialized_graph_def = graph_def
+    else:
+        serialized_graph_def = graph_def.SerializeToString()
+    io_config_json = json.dumps(io_config, separators=(',', ':'))
+    cache_path = None
+    if tfn_args.dump_prefix is None:  # dump runs always invoke the compiler
+        # content-addressed executable cache; re-tracing an identical graph
+        # with identical compiler arguments skips neuron-cc entirely. The
+        # compiler's path and mtime are part of the key so that upgrading
+        # neuron-cc invalidates executables built by the old compiler
+        neuron_cc_stamp = '{}:{}'.format(neuron_cc, os.path.getmtime(neuron_cc))
+        cache_key = hashlib.blake2b(serialized_graph_def + io_config_json.encode()
+                                    + ' '.join(compiler_args).encode()
+                                    + neuron_cc_stamp.encode()).hexdigest()
+        cache_dir = os.environ.get(
+            'NEURON_CC_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'neuron-cc'))
+        cache_path = os.path.join(cache_dir, '{}.neff'.format(cache_key))
+        if os.path.isfile(cache_path):
+            with open(cache_path, 'rb') as f:
+                return f.read(), inputs, outputs
+    global _neuron_cc_reads_stdin
     with tempfile.TemporaryDirectory() as workdir:
+        proc_input = None
         if tfn_args.dump_prefix is not None:
+            # the user asked for the artifacts on disk; keep the file code path
             workdir = os.path.join(os.path.realpath(tfn_args.dump_prefix), node_name)
             os.makedirs(workdir, exist_ok=True)
-        input_path = os.path.join(workdir, neuron_cc_input_name)
+            input_path = os.path.join(workdir, neuron_cc_input_name)
+            with open(input_path, 'wb') as f:
+                f.write(serialized_graph_def)
+        elif _neuron_cc_reads_stdin is False:
+            # this build was already seen rejecting /dev/stdin
+            input_path = os.path.join(workdir, neuron_cc_input_name)
+            with open(input_path, 'wb') as f:
+                f.write(serialized_graph_def)
+        else:
+            # stream the GraphDef through stdin to skip one write+read cycle
+            input_path = '/dev/stdin'
+            proc_input = serialized_graph_def
         output_path = os.path.join(workdir, neuron_executable_name)
-        with open(input_path, 'wb') as f:
-            f.write(graph_def.SerializeToString())
         command = [neuron_cc, 'compile', input_path, '--framework', 'TENSORFLOW',
                    '--pipeline', 'compile', 'SaveTemps', '--output', output_path]
-        command.extend(['--io-config', json.dumps(io_config)])
+        command.extend(['--io-config', io_config_json])
         command.extend(compiler_args)
         if tfn_args.log_level is not None:
             verbose = tfn_args.log_level
             if verbose not in {0, 1, 2}:  # set to default for unrecognized values
                 verbose = 35
             command.append('--verbose={}'.format(verbose))
-        proc = subprocess.run(command, cwd=workdir)
+        proc = subprocess.run(command, cwd=workdir, input=proc_input)
+        if proc_input is not None and _neuron_cc_reads_stdin is None:
+            if proc.returncode == 0:
+                _neuron_cc_reads_stdin = True
+            else:
+                # ambiguous first failure: either a genuine compile failure or
+                # a build that seeks/mmaps its input and cannot read
+                # /dev/stdin. Retry once through a real file to find out and
+                # latch the verdict -- a success means stdin is unusable, a
+                # second failure means the subgraph itself does not compile
+                input_path = os.path.join(workdir, neuron_cc_input_name)
+                with open(input_path, 'wb') as f:
+                    f.write(serialized_graph_def)
+                command[2] = input_path
+                proc = subprocess.run(command, cwd=workdir)
+                _neuron_cc_reads_stdin = proc.returncode != 0
         if proc.returncode != 0:
             return error_return_value
         with open(output_path, 'rb') as f:
             executable = f.read()
+        if cache_path is not None and executable:
+            cache_dir = os.path.dirname(cache_path)
+            os.makedirs(cache_dir, exist_ok=True)
+            # mkstemp gives each writer its own temp file, so concurrent
+            # compiles of identical subgraphs cannot interleave writes
+            temp_fd, temp_cache_path = tempfile.mkstemp(dir=cache_dir)
+            with os.fdopen(temp_fd, 'wb') as f:
+                f.write(executable)
+            os.replace(temp_cache_path, cache_path)  # atomic publish
     return executable, inputs, outputs
 
 
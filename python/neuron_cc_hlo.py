@@ -15,6 +15,7 @@
 import os
 import subprocess
 import tempfile
+from functools import lru_cache
 try:
     from tensorflow.compiler.tf2xla import tf2xla_pb2
 except ImportError:
@@ -98,10 +99,9 @@ Unpack
 '''
 
 
+@lru_cache(maxsize=1)
 def list_operators():
-    supported_operator_types = set(_SUPPORTED_OPERATOR_TYPES.split('\n'))
-    supported_operator_types.remove('')
-    return supported_operator_types
+    return set(_SUPPORTED_OPERATOR_TYPES.split())
 
 
 def compile_savetemps(graph_def, inputs, outputs, node_name):